@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, field_validator, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, field_validator, EmailStr
 import re
 from datetime import date, datetime
 from typing import Optional
@@ -83,8 +83,7 @@ class UserOutput(BaseModel):
     location: Optional[str]
     birthdate: Optional[date]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserPasswordUpdate(BaseModel):
     """
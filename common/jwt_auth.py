@@ -0,0 +1,77 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Callable
+from cachetools import TLRUCache
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+# Modulo condiviso dai microservizi che verificano i token JWT (field-service, image-service, intelligent-service),
+# copiato nelle rispettive immagini tramite il contesto di build aggiuntivo "common" definito nel docker-compose
+
+TOKEN_CACHE_MAX_TTL = 300 # Tempo di vita massimo in secondi dei token validati memorizzati in cache (5 minuti)
+
+logger = logging.getLogger(__name__)
+
+def load_public_key(pem: str):
+    """
+    Carica la chiave pubblica PEM in un oggetto chiave RSA, in modo che non venga rielaborata a ogni decodifica del token.
+    Args:
+        pem (str): Chiave pubblica in formato PEM.
+    Returns:
+        L'oggetto chiave pubblica.
+    Raises:
+        RuntimeError: Se la chiave non è una chiave pubblica PEM valida: il servizio non può verificare alcun token.
+    """
+    try:
+        return load_pem_public_key(pem.encode())
+    except ValueError as e:
+        logger.critical("Chiave pubblica JWT non valida: %s", e)
+        raise RuntimeError("Variabile d'ambiente JWT_PUBLIC_KEY non valida: il servizio non può essere avviato.") from e
+
+def token_cache_expiration(key: bytes, payload: dict, now: float) -> float:
+    """
+    Calcola l'istante di scadenza di un token validato in cache, limitato dalla claim exp del token stesso.
+    Args:
+        key (bytes): Hash del token JWT.
+        payload (dict): Payload decodificato del token JWT.
+        now (float): Istante corrente.
+    Returns:
+        float: Istante di scadenza della voce in cache.
+    """
+    return min(payload.get("exp", now + TOKEN_CACHE_MAX_TTL), now + TOKEN_CACHE_MAX_TTL)
+
+class ValidatedTokenCache:
+    """
+    Cache dei token JWT già validati: evita di ripetere la verifica della firma RS256 per i token già visti.
+    Le dipendenze sincrone di FastAPI vengono eseguite nel threadpool, per cui gli accessi alla cache sono protetti da un lock;
+    la verifica della firma avviene fuori dal lock.
+    Attributes:
+        cache (TLRUCache): Payload dei token validati, indicizzati per hash del token.
+        lock (threading.Lock): Lock che serializza gli accessi alla cache.
+    """
+    def __init__(self, maxsize: int):
+        self.cache = TLRUCache(maxsize=maxsize, ttu=token_cache_expiration, timer=time.time)
+        self.lock = threading.Lock()
+
+    def get_or_validate(self, jwt_token: str, validate: Callable[[str], dict]) -> dict:
+        """
+        Restituisce il payload del token dalla cache, oppure lo valida e lo memorizza.
+        Args:
+            jwt_token (str): Token JWT da validare.
+            validate (Callable[[str], dict]): Funzione che verifica il token e ne restituisce il payload.
+        Returns:
+            dict: Payload decodificato del token JWT.
+        Raises:
+            jwt.InvalidTokenError: Se il token non è valido, propagata dalla funzione di validazione.
+        """
+        token_hash = hashlib.blake2b(jwt_token.encode(), digest_size=16).digest()
+        with self.lock:
+            payload = self.cache.get(token_hash)
+        if payload is not None:
+            return payload
+
+        payload = validate(jwt_token)
+        with self.lock:
+            self.cache[token_hash] = payload
+        return payload
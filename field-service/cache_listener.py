@@ -0,0 +1,102 @@
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+SENSORS_CHANGED_CHANNEL = "sensors_changed"
+
+# Trigger che notificano su SENSORS_CHANGED_CHANNEL ogni modifica ai sensori nei campi e ai tipi di sensori.
+# Le eliminazioni a cascata dei campi rimuovono anche le righe di field_sensors, quindi attivano comunque il trigger.
+TRIGGERS_DDL = (
+    f"""
+    CREATE OR REPLACE FUNCTION notify_sensors_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{SENSORS_CHANGED_CHANNEL}', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER trg_field_sensors_changed
+    AFTER INSERT OR UPDATE OR DELETE ON field_sensors
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_sensors_changed()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER trg_sensor_types_changed
+    AFTER INSERT OR UPDATE OR DELETE ON sensor_types
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_sensors_changed()
+    """,
+)
+
+async def install_triggers(engine: AsyncEngine):
+    """
+    Installa (o aggiorna) la funzione e i trigger PostgreSQL che pubblicano le notifiche di modifica dei sensori.
+    Args:
+        engine (AsyncEngine): Engine asincrono SQLAlchemy del database.
+    """
+    async with engine.begin() as conn:
+        for ddl in TRIGGERS_DDL:
+            await conn.exec_driver_sql(ddl)
+
+class SensorsCacheListener:
+    """
+    Cache in memoria dell'elenco dei sensori attivi, invalidata tramite PostgreSQL LISTEN/NOTIFY.
+    Una connessione asyncpg dedicata resta in ascolto sul canale delle notifiche e svuota la cache
+    a ogni modifica, così i dati possono restare in cache senza TTL e senza diventare obsoleti.
+    Se la connessione di ascolto non è attiva, la cache viene disabilitata.
+    Attributes:
+        dsn (str): DSN di connessione a PostgreSQL.
+        channel (str): Nome del canale LISTEN/NOTIFY.
+    """
+    def __init__(self, dsn: str, channel: str = SENSORS_CHANGED_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.connection = None
+        self.listening = False
+        self.version = 0
+        self._value = None
+
+    async def connect(self):
+        """
+        Apre la connessione dedicata e si mette in ascolto sul canale delle notifiche.
+        """
+        self.connection = await asyncpg.connect(self.dsn)
+        self.connection.add_termination_listener(self._on_termination)
+        await self.connection.add_listener(self.channel, self._on_notify)
+        self.listening = True
+
+    def get(self):
+        """
+        Restituisce il valore in cache, oppure None se assente o se la cache non è attiva.
+        """
+        return self._value if self.listening else None
+
+    def set(self, value, version: int):
+        """
+        Salva un valore in cache solo se nel frattempo non è arrivata alcuna invalidazione.
+        Args:
+            value: Valore da salvare.
+            version (int): Versione della cache letta prima di interrogare il database.
+        """
+        if self.listening and version == self.version:
+            self._value = value
+
+    def invalidate(self):
+        """
+        Svuota la cache e ne incrementa la versione.
+        """
+        self.version += 1
+        self._value = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.invalidate()
+
+    def _on_termination(self, connection):
+        self.listening = False
+        self.invalidate()
+
+    async def close(self):
+        """
+        Chiude la connessione di ascolto.
+        """
+        self.listening = False
+        if self.connection and not self.connection.is_closed():
+            await self.connection.close()
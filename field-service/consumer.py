@@ -2,12 +2,24 @@ from aio_pika import connect_robust, IncomingMessage
 from database import AsyncSessionLocal
 from datetime import datetime
 from models import SensorReadings
+import asyncio
 import json
+import logging
+
+PREFETCH_COUNT = 100 # Numero massimo di messaggi non confermati consegnati al consumer
+BATCH_SIZE = 64 # Numero di letture accumulate prima dell'inserimento nel database
+FLUSH_INTERVAL = 0.2 # Tempo massimo in secondi di attesa di un batch incompleto prima dell'inserimento
+
+# Colonne della tabella delle letture scritte con COPY, nell'ordine dei valori dei record
+READING_COLUMNS = ("sensor_id", "field_id", "sensor_type", "value", "unit", "timestamp")
+
+# Logger del modulo: i messaggi per singolo batch sono di livello DEBUG e non vengono formattati se il livello è disabilitato
+logger = logging.getLogger(__name__)
 
 class RabbitMQFieldConsumer:
     """
     Consumer RabbitMQ per il servizio di field-service. Consuma messaggi dalla coda specificata,
-    elabora i dati dei sensori e li inserisce nel database.
+    elabora i dati dei sensori e li inserisce nel database a batch, confermando tutti i messaggi del batch con un unico ack.
     Attributes:
         rabbitmq_url (str): URL di connessione a RabbitMQ.
         queue_name (str): Nome della coda da cui consumare i messaggi.
@@ -18,6 +30,9 @@ class RabbitMQFieldConsumer:
         self.connection = None
         self.channel = None
         self.queue = None
+        self.batch = []
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
 
     async def connect(self):
         """
@@ -26,44 +41,88 @@ class RabbitMQFieldConsumer:
         self.connection = await connect_robust(self.rabbitmq_url)
         self.channel = await self.connection.channel()
 
-        # Imposta la qualità del servizio (QoS). Limita il numero massimo di messaggi non confermati a 10 per volta.
-        await self.channel.set_qos(prefetch_count=10)
+        # Imposta la qualità del servizio (QoS). Il prefetch permette di ricevere un intero batch di letture alla volta.
+        await self.channel.set_qos(prefetch_count=PREFETCH_COUNT)
 
         self.queue = await self.channel.declare_queue(self.queue_name, durable=True)
         await self.queue.consume(self.handle_message)
 
     async def handle_message(self, message: IncomingMessage):
         """
-        Elabora i messaggi ricevuti dalla coda. Decodifica il payload JSON,
-        converte il timestamp e inserisce i dati nel database.
+        Elabora i messaggi ricevuti dalla coda. Decodifica il payload JSON, converte il timestamp
+        e accoda la lettura al batch corrente, che viene inserito nel database quando è pieno o allo scadere del timer.
         Args:
             message (IncomingMessage): Messaggio ricevuto dalla coda RabbitMQ.
         """
-        async with message.process(requeue=True):
-            try:
-                payload = json.loads(message.body.decode())
-                payload["timestamp"] = datetime.fromisoformat(payload["timestamp"])
-
-                print(f"Received message: {payload}")
-
-                async with AsyncSessionLocal() as session:
-                    try:
-                        new_reading = SensorReadings(**payload)
-                        session.add(new_reading)
-                        await session.commit()
-                        print(f"Inserted sensor reading into database: {new_reading}")
-                    except Exception as db_error:
-                        await session.rollback()
-                        print(f"Database error: {db_error}")
-                        raise db_error
-
-            except Exception as e:
-                print(f"Errore nel processing del messaggio: {e}")
-                raise e
-    
+        try:
+            payload = json.loads(message.body.decode())
+            # Il record segue l'ordine di READING_COLUMNS; value viene convertito in float come richiesto dalla colonna double precision
+            record = (
+                payload["sensor_id"],
+                payload["field_id"],
+                payload["sensor_type"],
+                float(payload["value"]),
+                payload["unit"],
+                datetime.fromisoformat(payload["timestamp"])
+            )
+        except Exception as e:
+            # Un messaggio non decodificabile non diventerebbe valido con una nuova consegna: viene rifiutato senza
+            # rimetterlo in coda, altrimenti verrebbe riconsegnato all'infinito in testa ai batch
+            logger.error("Messaggio non valido scartato: %s (%r)", e, message.body[:256])
+            await message.reject(requeue=False)
+            return
+
+        self.batch.append((message, record))
+
+        if len(self.batch) >= BATCH_SIZE:
+            await self.flush()
+        elif self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        """
+        Attende l'intervallo di flush e inserisce nel database il batch incompleto.
+        """
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """
+        Inserisce nel database le letture del batch corrente con un'unica COPY, che evita il parsing SQL di ogni riga,
+        e conferma tutti i messaggi del batch con un solo ack cumulativo. In caso di errore i messaggi vengono rimessi in coda.
+        """
+        async with self.flush_lock:
+            if not self.batch:
+                return
+
+            batch, self.batch = self.batch, []
+            last_message = batch[-1][0]
+            records = [record for _, record in batch]
+
+            async with AsyncSessionLocal() as session:
+                try:
+                    connection = await session.connection()
+                    raw_connection = await connection.get_raw_connection()
+                    await raw_connection.driver_connection.copy_records_to_table(
+                        SensorReadings.__tablename__, records=records, columns=READING_COLUMNS
+                    )
+                    await session.commit()
+                    logger.debug("%d letture dei sensori inserite nel database", len(records))
+                except Exception as db_error:
+                    await session.rollback()
+                    logger.exception("Errore del database durante l'inserimento del batch: %s", db_error)
+                    await last_message.nack(multiple=True, requeue=True)
+                    return
+
+            # L'ack cumulativo conferma tutti i messaggi consegnati fino all'ultimo del batch
+            await last_message.ack(multiple=True)
+
     async def close(self):
         """
-        Chiude la connessione a RabbitMQ.
+        Inserisce le letture ancora in attesa e chiude la connessione a RabbitMQ.
         """
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
         if self.connection:
-            await self.connection.close()
\ No newline at end of file
+            await self.flush()
+            await self.connection.close()
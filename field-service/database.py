@@ -7,11 +7,24 @@ DB_USER = os.getenv("POSTGRES_USER", "admin")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "admin123")
 DB_NAME = os.getenv("POSTGRES_DB", "greenfield_auth_db")
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1" # Registra ogni istruzione SQL eseguita, da abilitare solo in sviluppo
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# Crea l'engine asincrono per SQLAlchemy
-engine = create_async_engine(DATABASE_URL, echo=True, pool_size=20)
+# DSN nativo di asyncpg, utilizzato dalla connessione dedicata alle notifiche LISTEN/NOTIFY
+LISTENER_DSN = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Crea l'engine asincrono per SQLAlchemy.
+# Il pool è dimensionato per le richieste concorrenti di FastAPI, le connessioni vengono riciclate ogni 30 minuti
+# e asyncpg mantiene in cache per connessione i prepared statement delle query ripetute.
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=SQL_ECHO,
+    pool_size=20,
+    max_overflow=40,
+    pool_recycle=1800,
+    connect_args={"statement_cache_size": 1024}
+)
 
 # Crea una sessione asincrona
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
@@ -1,6 +1,31 @@
-from sqlalchemy import Column, Integer, String, Date, Boolean, Double, Computed, ForeignKey, UniqueConstraint, DateTime, Index
+from sqlalchemy import Column, Integer, String, Date, Boolean, Double, Computed, ForeignKey, UniqueConstraint, DateTime, Index, func
+from sqlalchemy.orm import relationship
 from database import Base
 
+# DDL idempotente che aggiunge ai database esistenti le colonne e gli indici introdotti dopo la creazione delle tabelle,
+# poiché create_all crea solo le tabelle mancanti e non modifica quelle già presenti.
+# L'indice composito delle letture esisteva già senza colonne incluse: in quel caso viene ricreato nella versione coprente.
+SCHEMA_UPGRADES_DDL = (
+    "ALTER TABLE fields ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now()",
+    "ALTER TABLE sensor_types ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now()",
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = 'idx_sensor_readings_field_type_time' AND i.indnatts = i.indnkeyatts
+        ) THEN
+            DROP INDEX idx_sensor_readings_field_type_time;
+        END IF;
+    END $$
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_sensor_readings_field_type_time
+    ON sensor_readings (field_id, sensor_type, "timestamp" DESC) INCLUDE (sensor_id, value, unit)
+    """,
+)
+
 class Field(Base):
     """
     Schema della tabella del database per i campi agricoli.
@@ -16,6 +41,8 @@ class Field(Base):
         size (int): Dimensione del campo in ettari.
         is_indoor (bool): Indica se il campo è indoor o outdoor.
         owner_id (int): Identificatore del proprietario del campo.
+        updated_at (datetime): Istante dell'ultima modifica del campo.
+        sensors (list[FieldSensors]): Sensori del campo, da caricare esplicitamente con selectinload.
     """
     __tablename__ = 'fields'
 
@@ -30,6 +57,17 @@ class Field(Base):
     size = Column(Integer, nullable=False)
     is_indoor = Column(Boolean, nullable=False)
     owner_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    # Il caricamento implicito solleva un'eccezione, così ogni query deve dichiarare il caricamento dei sensori (niente N+1);
+    # l'eliminazione dei sensori è delegata al vincolo ON DELETE CASCADE del database
+    sensors = relationship("FieldSensors", back_populates="field_obj", lazy="raise", passive_deletes=True)
+
+    # Indici per ottimizzare i controlli di proprietà (risolti con una scansione del solo indice) e l'elenco dei campi di un utente
+    __table_args__ = (
+        Index('ix_fields_field_owner', 'field', 'owner_id', unique=True),
+        Index('ix_fields_owner_id', 'owner_id'),
+    )
 
 class SensorType(Base):
     """
@@ -41,6 +79,8 @@ class SensorType(Base):
         description (str): Descrizione del tipo di sensore.
         unit (str): Unità di misura del sensore.
         owner_id (int): Identificatore del proprietario del tipo di sensore.
+        updated_at (datetime): Istante dell'ultima modifica del tipo di sensore.
+        field_sensors (list[FieldSensors]): Sensori di questo tipo, da caricare esplicitamente con selectinload.
     """
     __tablename__ = 'sensor_types'
 
@@ -50,6 +90,10 @@ class SensorType(Base):
     description = Column(String, nullable=True)
     unit = Column(String, nullable=False)
     owner_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    # L'eliminazione di un tipo ancora in uso viene impedita dal vincolo ON DELETE RESTRICT, senza caricare i sensori
+    field_sensors = relationship("FieldSensors", back_populates="sensor_type_rel", lazy="raise", passive_deletes=True)
 
     # Vincolo di unicità combinato su owner_id e type_name (un proprietario non può avere due tipi di sensori con lo stesso nome)
     __table_args__ = (
@@ -67,7 +111,10 @@ class FieldSensors(Base):
         location (str): Posizione del sensore nel campo.
         active (bool): Indica se il sensore è attivo o meno.
         field_name (str): Nome del campo a cui il sensore appartiene (chiave esterna).
-        owner_id (int): Identificatore del proprietario del sensore."""
+        owner_id (int): Identificatore del proprietario del sensore.
+        sensor_type_rel (SensorType): Tipo di sensore associato, da caricare esplicitamente
+            (con le sessioni asincrone il caricamento lazy non è possibile).
+        field_obj (Field): Campo a cui il sensore appartiene, da caricare esplicitamente."""
     __tablename__ = 'field_sensors'
 
     id = Column(Integer, primary_key=True, unique=True, index=True)
@@ -80,14 +127,20 @@ class FieldSensors(Base):
     field_name = Column(String, ForeignKey("fields.field", onupdate="CASCADE", ondelete="CASCADE"), nullable=False)
     owner_id = Column(Integer, nullable=False)
 
+    sensor_type_rel = relationship("SensorType", back_populates="field_sensors", lazy="raise")
+    field_obj = relationship("Field", back_populates="sensors", lazy="raise")
+
     # Vincolo di unicità combinato su sensor_id e field_name (un sensore non può essere duplicato nello stesso campo)
+    # e indice per ottimizzare l'elenco dei sensori di un campo dell'utente
     __table_args__ = (
         UniqueConstraint('sensor_id', 'field_name', name='uix_sensor_id_field_name'),
+        Index('ix_field_sensors_field_owner', 'field_name', 'owner_id'),
     )
 
 class SensorReadings(Base):
     """
     Schema della tabella del database per le letture dei sensori.
+    La tabella è una hypertable TimescaleDB partizionata per timestamp, per cui il timestamp fa parte della chiave primaria.
     Attributes:
         id (int): Identificatore univoco della lettura del sensore.
         sensor_id (str): Identificatore del sensore.
@@ -99,15 +152,18 @@ class SensorReadings(Base):
     """
     __tablename__ = 'sensor_readings'
 
-    id = Column(Integer, primary_key=True, unique=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     sensor_id = Column(String, nullable=False)
     field_id = Column(String, nullable=False)
     sensor_type = Column(String, nullable=False)
     value = Column(Double, nullable=False)
     unit = Column(String, nullable=False)
-    timestamp = Column(DateTime(timezone=True), nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True)
 
-    # Indice per ottimizzare le query basate su field_id, sensor_type e timestamp in ordine decrescente 
+    # Indici per ottimizzare le query basate su field_id, sensor_type e timestamp in ordine decrescente
+    # e le ultime rilevazioni di un campo indipendentemente dal tipo di sensore.
+    # Il primo include le colonne restituite dalle letture, che vengono così servite con una scansione del solo indice
     __table_args__ = (
-        Index('idx_sensor_readings_field_type_time', 'field_id', 'sensor_type', timestamp.desc()),
+        Index('idx_sensor_readings_field_type_time', 'field_id', 'sensor_type', timestamp.desc(), postgresql_include=['sensor_id', 'value', 'unit']),
+        Index('idx_sensor_readings_field_time', 'field_id', timestamp.desc()),
     )
\ No newline at end of file
@@ -0,0 +1,34 @@
+import asyncio
+
+class MinIntervalLimiter:
+    """
+    Limitatore asincrono che serializza le richieste verso un servizio esterno e ne distanzia l'avvio di almeno
+    min_interval secondi, come richiesto dalle policy di utilizzo dei servizi pubblici (es. Nominatim, 1 richiesta al secondo).
+    Si utilizza come context manager asincrono attorno alla richiesta: l'attesa avviene tenendo il lock,
+    per cui le richieste in coda partono una alla volta alla cadenza consentita.
+    Attributes:
+        min_interval (float): Intervallo minimo in secondi tra l'avvio di due richieste consecutive.
+        lock (asyncio.Lock): Lock che consente una sola richiesta alla volta.
+        last_request (float): Istante (orologio dell'event loop) di avvio dell'ultima richiesta.
+    """
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.lock = asyncio.Lock()
+        self.last_request = float("-inf")
+
+    async def __aenter__(self):
+        await self.lock.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            wait = self.last_request + self.min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_request = loop.time()
+        except BaseException:
+            # Una richiesta annullata durante l'attesa non deve lasciare il lock acquisito
+            self.lock.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.lock.release()
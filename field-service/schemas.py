@@ -1,14 +1,18 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator, model_validator
 from typing import Optional
 from datetime import date, datetime
 import re
 
 # Espressione regolare pattern per validare la posizione geografica nel formato "Città (latitudine, longitudine)"
-LOCATION_PATTERN = r"^[A-Za-zÀ-ÖØ-öø-ÿ' -]+ \((-?\d+(?:\.\d+)?), (-?\d+(?:\.\d+)?)\)$"
+# I gruppi nominati permettono di estrarre città e coordinate dalla stessa espressione usata per la validazione
+LOCATION_PATTERN = r"^(?P<city>[A-Za-zÀ-ÖØ-öø-ÿ' -]+) \((?P<lat>-?\d+(?:\.\d+)?), (?P<lon>-?\d+(?:\.\d+)?)\)$"
+# Espressione regolare compilata una sola volta all'import del modulo
+LOCATION_RE = re.compile(LOCATION_PATTERN)
 
 class FieldCreation(BaseModel):
     """
     Modello per la creazione di un nuovo campo.
+    Città, latitudine e longitudine vengono estratte dalla posizione durante la validazione.
     """
     name: str = Field(..., example="Vigna Nord", description="Nome del campo")
     location: str = Field(..., example="Rutigliano (41.1234, 16.1234)", description="Posizione geografica del campo nel formato 'Città (latitudine, longitudine)'")
@@ -17,15 +21,33 @@ class FieldCreation(BaseModel):
     size: float = Field(..., example=2.5, description="Dimensione del campo in ettari")
     is_indoor: bool = Field(..., example=False, description="Indica se il campo è coperto (serra) o all'aperto")
 
+    _city: str = PrivateAttr()
+    _latitude: float = PrivateAttr()
+    _longitude: float = PrivateAttr()
+
+    @property
+    def city(self) -> str:
+        return self._city
+
+    @property
+    def latitude(self) -> float:
+        return self._latitude
+
+    @property
+    def longitude(self) -> float:
+        return self._longitude
+
     @field_validator("name")
     def validate_name(cls, value):
-        if not value.strip():
+        value = value.strip()
+        if not value:
             raise ValueError("Il nome del campo non può essere vuoto.")
         return value
     
     @field_validator("cultivation_type")
     def validate_cultivation_type(cls, value):
-        if not value.strip():
+        value = value.strip()
+        if not value:
             raise ValueError("Il tipo di coltivazione non può essere vuoto.")
         return value
 
@@ -38,21 +60,24 @@ class FieldCreation(BaseModel):
     
     @field_validator("location")
     def validate_location(cls, value):
-        if not re.fullmatch(LOCATION_PATTERN, value):
+        if not LOCATION_RE.fullmatch(value):
             raise ValueError("La posizione geografica deve essere nel formato 'Città (latitudine, longitudine)'.")
         return value
 
+    @model_validator(mode="after")
+    def parse_location(self):
+        # Eseguito solo se la posizione ha superato la validazione del formato, quindi il match è sempre presente
+        match = LOCATION_RE.fullmatch(self.location)
+        self._city = match["city"]
+        self._latitude = float(match["lat"])
+        self._longitude = float(match["lon"])
+        return self
+
     @field_validator("start_date")
     def validate_start_date(cls, value):
-        if value and value > datetime.now().date():
+        if value and value > date.today():
             raise ValueError("La data di inizio non può essere nel futuro.")
         return value
-    
-    @field_validator("is_indoor")
-    def validate_is_indoor(cls, value):
-        if not isinstance(value, bool):
-            raise ValueError("Il campo 'is_indoor' deve essere un valore booleano.")
-        return value
 
 class FieldOutput(BaseModel):
     """
@@ -66,8 +91,7 @@ class FieldOutput(BaseModel):
     cultivation_type: str = Field(..., example="Uva da tavola", description="Tipo di coltivazione presente nel campo")
     size: float = Field(..., example=2.5, description="Dimensione del campo in ettari")
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class FieldUpdate(BaseModel):
     """
@@ -81,14 +105,18 @@ class FieldUpdate(BaseModel):
 
     @field_validator("name")
     def validate_name(cls, value):
-        if value is not None and not value.strip():
-            raise ValueError("Il nome del campo non può essere vuoto.")
+        if value is not None:
+            value = value.strip()
+            if not value:
+                raise ValueError("Il nome del campo non può essere vuoto.")
         return value
     
     @field_validator("cultivation_type")
     def validate_cultivation_type(cls, value):
-        if value is not None and not value.strip():
-            raise ValueError("Il tipo di coltivazione non può essere vuoto.")
+        if value is not None:
+            value = value.strip()
+            if not value:
+                raise ValueError("Il tipo di coltivazione non può essere vuoto.")
         return value
 
     @field_validator("size")
@@ -96,12 +124,6 @@ class FieldUpdate(BaseModel):
         if value is not None and value <= 0:
             raise ValueError("La dimensione del campo deve essere un valore positivo.")
         return value
-    
-    @field_validator("is_indoor")
-    def validate_is_indoor(cls, value):
-        if value is not None and not isinstance(value, bool):
-            raise ValueError("Il campo 'is_indoor' deve essere un valore booleano.")
-        return value
 
 class SensorTypeCreation(BaseModel):
     """
@@ -111,8 +133,7 @@ class SensorTypeCreation(BaseModel):
     description: Optional[str] = Field(None, example="Sensore per misurare la temperatura dell'aria", description="Descrizione del sensore")
     unit: str = Field(..., example="°C", description="Unità di misura del sensore, ad esempio '°C', '%', ecc...")
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class SensorTypeOutput(BaseModel):
     """
@@ -123,8 +144,7 @@ class SensorTypeOutput(BaseModel):
     description: Optional[str] = Field(None, example="Sensore per misurare la temperatura dell'aria", description="Descrizione del sensore")
     unit: str = Field(..., example="°C", description="Unità di misura del sensore, ad esempio '°C', '%', ecc...")
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class NewSensorInField(BaseModel):
     """
@@ -137,30 +157,26 @@ class NewSensorInField(BaseModel):
 
     @field_validator("sensor_id")
     def validate_sensor_id(cls, value):
-        if not value.strip():
+        value = value.strip()
+        if not value:
             raise ValueError("L'identificativo del sensore non può essere vuoto.")
         return value
     
     @field_validator("sensor_type")
     def validate_sensor_type(cls, value):
-        if not value.strip():
+        value = value.strip()
+        if not value:
             raise ValueError("Il tipo di sensore non può essere vuoto.")
         return value
     
     @field_validator("location")
     def validate_location(cls, value):
-        if not value.strip():
+        value = value.strip()
+        if not value:
             raise ValueError("La posizione del sensore non può essere vuota.")
         return value
-    
-    @field_validator("active")
-    def validate_active(cls, value):
-        if not isinstance(value, bool):
-            raise ValueError("Il campo 'active' deve essere un valore booleano.")
-        return value
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class SensorInFieldOutput(BaseModel):
     """
@@ -170,8 +186,7 @@ class SensorInFieldOutput(BaseModel):
     sensor_type: str = Field(..., example="temperatura", description="Tipo di sensore, ad esempio 'temperatura', 'umidità', ecc...")
     location: str = Field(..., example="Nord Est", description="Posizione del sensore all'interno del campo")
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class SensorReadingOutput(BaseModel):
     """
@@ -183,5 +198,4 @@ class SensorReadingOutput(BaseModel):
     unit: str = Field(..., example="°C", description="Unità di misura del sensore")
     timestamp: datetime = Field(..., example="2024-01-01 12:00:00", description="Timestamp della lettura del sensore")
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
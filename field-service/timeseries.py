@@ -0,0 +1,43 @@
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+HYPERTABLE_CHUNK_INTERVAL = "7 days" # Intervallo temporale coperto da ciascuna partizione (chunk) della hypertable
+
+# DDL che converte sensor_readings in una hypertable TimescaleDB partizionata per timestamp.
+# Le istruzioni sono idempotenti: la chiave primaria viene estesa a (id, timestamp) solo se non include già il timestamp,
+# poiché TimescaleDB richiede che ogni indice univoco contenga la colonna di partizionamento.
+TIMESCALE_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS timescaledb",
+    "DROP INDEX IF EXISTS ix_sensor_readings_id",
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = 'sensor_readings'::regclass AND i.indisprimary AND a.attname = 'timestamp'
+        ) THEN
+            ALTER TABLE sensor_readings DROP CONSTRAINT sensor_readings_pkey, ADD PRIMARY KEY (id, "timestamp");
+        END IF;
+    END $$
+    """,
+    f"""
+    SELECT create_hypertable(
+        'sensor_readings', 'timestamp',
+        chunk_time_interval => INTERVAL '{HYPERTABLE_CHUNK_INTERVAL}',
+        if_not_exists => TRUE,
+        migrate_data => TRUE
+    )
+    """,
+    # L'aggregato continuo orario creato in precedenza non è letto da nessuna query: viene rimosso insieme alla sua policy
+    "DROP MATERIALIZED VIEW IF EXISTS sensor_readings_1h",
+)
+
+async def install_timescale(engine: AsyncEngine):
+    """
+    Converte la tabella delle letture in una hypertable TimescaleDB. Può essere eseguita a ogni avvio.
+    Args:
+        engine (AsyncEngine): Engine asincrono SQLAlchemy del database.
+    """
+    async with engine.begin() as conn:
+        for ddl in TIMESCALE_DDL:
+            await conn.exec_driver_sql(ddl)
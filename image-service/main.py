@@ -1,13 +1,33 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, status, Depends
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.security import OAuth2PasswordBearer
+from concurrent.futures import ProcessPoolExecutor
+from cachetools import LRUCache
+from typing import Optional
+from bisect import bisect_right
+from functools import lru_cache
+import asyncio
+import hashlib
+import os
+
+NDVI_POOL_WORKERS = os.cpu_count() or 1 # Numero di processi del pool per il calcolo dell'NDVI, uno per core
+
+# Thread di decompressione dei TIFF per ciascun processo del pool, in modo che processi e thread insieme non superino
+# il numero di core; va impostata prima dell'inizializzazione di GDAL ed è ereditata dai processi del pool
+os.environ.setdefault("GDAL_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // NDVI_POOL_WORKERS)))
+
 import numpy as np
 from rasterio.io import MemoryFile
+from rasterio.windows import Window
+from matplotlib.colors import Normalize
+from matplotlib.cm import ScalarMappable
 import matplotlib.pyplot as plt
+from PIL import Image
 import io
 import base64
-import os
+from urllib.parse import quote
 import jwt
+from jwt_auth import load_public_key, ValidatedTokenCache
 
 # Utilizzo del backend 'Agg' per matplotlib per evitare problemi in ambienti senza display
 plt.switch_backend('Agg')
@@ -17,9 +37,85 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 PUBLIC_KEY = os.getenv("JWT_PUBLIC_KEY", "PUBLIC_KEY").replace("\\n", "\n")
 
+PUBLIC_KEY_OBJ = load_public_key(PUBLIC_KEY)
+
 ALGORITHM = "RS256"
 
-app = FastAPI(title="Image Service")
+# Cache dei token JWT già validati, condivisa dai thread che eseguono la dipendenza di autenticazione
+validated_tokens = ValidatedTokenCache(maxsize=10000)
+
+NDVI_COLORMAP = "RdYlGn" # Colormap utilizzata per la rappresentazione dell'NDVI
+WINDOWED_READ_MIN_PIXELS = 4096 * 4096 # Oltre questa dimensione le bande vengono lette a blocchi per limitare la memoria di picco
+PNG_COMPRESS_LEVEL = 1 # Livello di compressione zlib del PNG: privilegia la velocità di codifica rispetto alla dimensione
+
+# Tabella di lookup (256x4, uint8) dei colori RGBA della colormap, calcolata una sola volta all'avvio
+NDVI_LUT = (plt.get_cmap(NDVI_COLORMAP)(np.linspace(0, 1, 256)) * 255).round().astype(np.uint8)
+
+def render_ndvi_legend() -> Image.Image:
+    """
+    Disegna con matplotlib la legenda (barra dei colori con le etichette dei valori NDVI) una sola volta all'avvio.
+    Returns:
+        Image.Image: Immagine RGBA della legenda.
+    """
+    fig = plt.figure(figsize=(1.1, 6))
+    ax = fig.add_axes([0.15, 0.05, 0.25, 0.85])
+    cbar = fig.colorbar(ScalarMappable(norm=Normalize(vmin=0, vmax=1), cmap=NDVI_COLORMAP), cax=ax)
+    cbar.set_ticks([0, 0.25, 0.5, 0.75, 1])
+    cbar.set_ticklabels(['-1.0', '-0.5', '0.0', '0.5', '1.0'])
+    ax.set_title('NDVI')
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=100, transparent=True)
+    plt.close(fig)
+    buffer.seek(0)
+
+    return Image.open(buffer).convert('RGBA')
+
+# Legenda pre-renderizzata, composta su ogni immagine NDVI senza ricreare la figura matplotlib
+NDVI_LEGEND = render_ndvi_legend()
+
+@lru_cache(maxsize=32)
+def ndvi_legend_for_height(height: int) -> Image.Image:
+    """
+    Restituisce la legenda adatta a un'immagine NDVI dell'altezza indicata.
+    La legenda viene ingrandita solo se l'immagine è più alta, per mantenerla leggibile; le versioni ridimensionate
+    restano in cache, così le immagini della stessa dimensione non ripetono il ridimensionamento.
+    Args:
+        height (int): Altezza in pixel dell'immagine NDVI.
+    Returns:
+        Image.Image: Immagine RGBA della legenda.
+    """
+    if height <= NDVI_LEGEND.height:
+        return NDVI_LEGEND
+    return NDVI_LEGEND.resize((NDVI_LEGEND.width * height // NDVI_LEGEND.height, height), Image.LANCZOS)
+
+# Soglie dell'NDVI medio e relative descrizioni: la descrizione i-esima vale per i valori sotto la soglia i-esima
+NDVI_THRESHOLDS = (0.0, 0.2, 0.4, 0.6, 0.8)
+NDVI_DESCRIPTIONS = (
+    "La vegetazione è scarsa o assente.",
+    "La vegetazione è molto scarsa.",
+    "La vegetazione è scarsa.",
+    "La vegetazione è moderata.",
+    "La vegetazione è alta.",
+    "La vegetazione è molto alta."
+)
+
+# Pool di processi per la decodifica dei TIFF e il calcolo dell'NDVI, che altrimenti bloccherebbero l'event loop
+NDVI_POOL = ProcessPoolExecutor(max_workers=NDVI_POOL_WORKERS)
+
+NDVI_CACHE_MAX_BYTES = 128 * 1024 * 1024 # Dimensione massima in byte delle immagini PNG mantenute in cache (128 MiB)
+# Cache LRU dei risultati indicizzata per hash del contenuto del file, per non ricalcolare upload identici.
+# La capienza è misurata sui byte del PNG, che domina la dimensione di ciascun risultato
+ndvi_results = LRUCache(maxsize=NDVI_CACHE_MAX_BYTES, getsizeof=lambda result: len(result[2]))
+
+app = FastAPI(title="Image Service", default_response_class=ORJSONResponse)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """
+    Evento di shutdown per terminare il pool di processi dedicato al calcolo dell'NDVI.
+    """
+    NDVI_POOL.shutdown(cancel_futures=True)
 
 def decode_access_token(jwt_token: str = Depends(oauth2_scheme)):
     """
@@ -32,8 +128,7 @@ def decode_access_token(jwt_token: str = Depends(oauth2_scheme)):
         HTTPException: Se il token è scaduto o non valido.
     """
     try:
-        payload = jwt.decode(jwt_token, PUBLIC_KEY, algorithms=[ALGORITHM])
-        return payload
+        return validated_tokens.get_or_validate(jwt_token, lambda token: jwt.decode(token, PUBLIC_KEY_OBJ, algorithms=[ALGORITHM]))
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token di accesso scaduto.")
     except jwt.InvalidTokenError:
@@ -42,88 +137,158 @@ def decode_access_token(jwt_token: str = Depends(oauth2_scheme)):
 def calculate_ndvi(red_band, nir_band):
     """
     Calcola l'indice NDVI a partire dalle bande Red e NIR.
+    Le operazioni vengono eseguite in place per evitare le matrici temporanee: la banda Red viene riutilizzata
+    come buffer del denominatore e non deve più essere letta dal chiamante.
     Args:
         red_band (np.ndarray): Banda Red dell'immagine.
         nir_band (np.ndarray): Banda NIR dell'immagine.
     Returns:
         np.ndarray: Matrice NDVI calcolata.
     """
-    ndvi = (nir_band - red_band) / (nir_band + red_band + 1e-10)
+    ndvi = np.subtract(nir_band, red_band)
+    denominator = red_band
+    denominator += nir_band
+    denominator += 1e-10
+    ndvi /= denominator
     return ndvi
 
-def ndvi_to_png_with_legend(ndvi: np.ndarray) -> io.BytesIO:
+def ndvi_to_lut_index(ndvi: np.ndarray, out: np.ndarray):
+    """
+    Converte i valori NDVI in [-1, 1] negli indici della tabella di lookup della colormap, scrivendoli in out.
+    La conversione avviene in place sulla matrice NDVI, che non deve più essere letta dal chiamante.
+    Args:
+        ndvi (np.ndarray): Matrice NDVI in float32.
+        out (np.ndarray): Matrice uint8 di destinazione degli indici (i valori NaN vengono mappati a 0).
+    """
+    ndvi += 1
+    ndvi *= 127.5
+    np.clip(ndvi, 0, 255, out=ndvi)
+    np.nan_to_num(ndvi, copy=False, nan=0.0)
+    np.copyto(out, ndvi, casting='unsafe')
+
+def read_ndvi_index(dataset) -> tuple:
     """
-    Converte una matrice NDVI in un'immagine PNG con legenda.
+    Legge le bande Red (3) e NIR (4) direttamente in float32 e calcola l'NDVI per blocchi, convertendo ciascun blocco
+    negli indici uint8 della colormap e accumulando somma e conteggio dei valori validi per la media.
+    L'NDVI in float32 esiste solo per il blocco corrente: a piena risoluzione restano gli indici (1 byte per pixel)
+    e, se presente, la maschera dei pixel non validi. Le immagini fino a WINDOWED_READ_MIN_PIXELS sono un unico blocco,
+    quelle più grandi vengono lette per blocchi interni del TIFF.
     Args:
-        ndvi (np.ndarray): Matrice NDVI.
+        dataset (rasterio.DatasetReader): Dataset raster aperto con almeno 4 bande.
     Returns:
-        io.BytesIO: Buffer contenente l'immagine PNG.
+        tuple: Indici nella tabella di lookup (np.ndarray uint8), maschera dei pixel NaN (np.ndarray, oppure None
+            se non ce ne sono) e NDVI medio dei pixel validi (float).
     """
-    ndvi_normalidzed = (ndvi + 1) / 2
-    ndvi_normalidzed = np.clip(ndvi_normalidzed, 0, 1)
+    shape = (dataset.height, dataset.width)
+    if dataset.width * dataset.height <= WINDOWED_READ_MIN_PIXELS:
+        windows = [Window(0, 0, dataset.width, dataset.height)]
+    else:
+        windows = [window for _, window in dataset.block_windows(3)]
+
+    index = np.empty(shape, dtype=np.uint8)
+    invalid = None
+    total = 0.0
+    count = 0
 
-    cmap = plt.get_cmap('RdYlGn')
+    for window in windows:
+        red_band, nir_band = dataset.read([3, 4], window=window, out_dtype=np.float32)
+        ndvi = calculate_ndvi(red_band, nir_band)
+        block = window.toslices()
 
-    fig, ax = plt.subplots(figsize=(8, 6))
-    img = ax.imshow(ndvi_normalidzed, cmap=cmap, vmin=0, vmax=1)
-    ax.axis('off')
-    ax.set_title('NDVI index')
+        block_invalid = np.isnan(ndvi)
+        if block_invalid.any():
+            if invalid is None:
+                invalid = np.zeros(shape, dtype=bool)
+            invalid[block] = block_invalid
+            total += float(np.nansum(ndvi, dtype=np.float64))
+            count += ndvi.size - int(np.count_nonzero(block_invalid))
+        else:
+            total += float(ndvi.sum(dtype=np.float64))
+            count += ndvi.size
 
-    ticks = [0, 0.25, 0.5, 0.75, 1]
+        ndvi_to_lut_index(ndvi, out=index[block])
 
-    cbar = fig.colorbar(img, ax=ax, fraction=0.046, pad=0.04)
-    cbar.set_ticks(ticks)
-    cbar.set_ticklabels(['-1.0', '-0.5', '0.0', '0.5', '1.0'])
+    mean_ndvi = total / count if count else float('nan')
+    return index, invalid, mean_ndvi
+
+def ndvi_to_png_with_legend(lut_index: np.ndarray, invalid: Optional[np.ndarray] = None) -> io.BytesIO:
+    """
+    Converte una matrice NDVI, già quantizzata negli indici della colormap, in un'immagine PNG con legenda.
+    I colori vengono ottenuti con un'unica indicizzazione vettoriale nella tabella di lookup della colormap
+    e la legenda pre-renderizzata viene composta a destra dell'immagine; i pixel non validi (NaN) restano trasparenti.
+    Args:
+        lut_index (np.ndarray): Matrice uint8 degli indici NDVI nella tabella di lookup.
+        invalid (Optional[np.ndarray]): Maschera dei pixel NaN; None se non ce ne sono.
+    Returns:
+        io.BytesIO: Buffer contenente l'immagine PNG.
+    """
+    rgba = NDVI_LUT[lut_index]
+    if invalid is not None:
+        rgba[invalid, 3] = 0
+
+    raster = Image.fromarray(rgba, 'RGBA')
+
+    legend = ndvi_legend_for_height(raster.height)
+
+    canvas = Image.new('RGBA', (raster.width + legend.width, max(raster.height, legend.height)), (255, 255, 255, 0))
+    canvas.alpha_composite(raster, dest=(0, (canvas.height - raster.height) // 2))
+    canvas.alpha_composite(legend, dest=(raster.width, (canvas.height - legend.height) // 2))
 
     buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', bbox_inches='tight', dpi=150)
-    plt.close(fig)
+    canvas.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
     buffer.seek(0)
 
     return buffer
 
-def png_to_base64(png_buffer: io.BytesIO) -> str:
+def png_to_base64(png_bytes: bytes) -> str:
     """
     Converte un'immagine PNG in una stringa base64.
     Args:
-        png_buffer (io.BytesIO): Buffer contenente l'immagine PNG.
+        png_bytes (bytes): Contenuto dell'immagine PNG.
     Returns:
         str: Stringa base64 dell'immagine PNG.
     """
-    return base64.b64encode(png_buffer.getvalue()).decode('utf-8')
+    return base64.b64encode(png_bytes).decode('utf-8')
 
-def ndvi_description(ndvi: np.ndarray) -> str:
+def ndvi_description(mean_ndvi: float) -> str:
     """
     Fornisce una descrizione testuale basata sul valore medio dell'NDVI.
     Args:
-        ndvi (np.ndarray): Matrice NDVI.
+        mean_ndvi (float): NDVI medio dell'immagine, calcolato una sola volta dal chiamante.
     Returns:
         str: Descrizione della vegetazione basata sull'NDVI medio."""
-    mean_ndvi = np.nanmean(ndvi)
-    if mean_ndvi < 0:
-        return "La vegetazione è scarsa o assente."
-    elif 0 <= mean_ndvi < 0.2:
-        return "La vegetazione è molto scarsa."
-    elif 0.2 <= mean_ndvi < 0.4:
-        return "La vegetazione è scarsa."
-    elif 0.4 <= mean_ndvi < 0.6:
-        return "La vegetazione è moderata."
-    elif 0.6 <= mean_ndvi < 0.8:
-        return "La vegetazione è alta."
-    else:
-        return "La vegetazione è molto alta."
-    
-@app.post("/compute-ndvi")
-async def compute_ndvi(file: UploadFile = File(...), token: dict = Depends(decode_access_token)):
+    return NDVI_DESCRIPTIONS[bisect_right(NDVI_THRESHOLDS, mean_ndvi)]
+
+def process_tiff(data: bytes) -> tuple:
     """
-    Calcola l'NDVI da un file TIFF caricato e restituisce l'immagine PNG codificata in base64 insieme a una descrizione testuale.
+    Decodifica il TIFF, calcola l'NDVI e genera l'immagine PNG con legenda.
+    Viene eseguita in un processo del pool, per cui deve restare una funzione di modulo serializzabile.
+    Args:
+        data (bytes): Contenuto del file TIFF caricato.
+    Returns:
+        tuple: NDVI medio (float) e contenuto dell'immagine PNG (bytes).
+    Raises:
+        ValueError: Se il file TIFF contiene meno di 4 bande.
+    """
+    with MemoryFile(data) as memfile:
+        with memfile.open() as dataset:
+            if dataset.count < 4:
+                raise ValueError("Il file TIFF deve contenere almeno 4 bande (inclusi Red e NIR).")
+
+            lut_index, invalid, mean_ndvi = read_ndvi_index(dataset)
+
+    png_buffer = ndvi_to_png_with_legend(lut_index, invalid)
+    return mean_ndvi, png_buffer.getvalue()
+
+async def compute_ndvi_result(file: UploadFile) -> tuple:
+    """
+    Calcola l'NDVI di un file TIFF caricato, servendo dalla cache gli upload con contenuto identico.
     Args:
         file (UploadFile): File TIFF caricato.
-        token (dict): Payload del token di accesso decodificato.
     Returns:
-        dict: Dizionario contenente il nome del file, la descrizione, l'NDVI medio e l'immagine NDVI in formato base64.
+        tuple: Descrizione della vegetazione (str), NDVI medio (float) e contenuto dell'immagine PNG con legenda (bytes).
     Raises:
-        HTTPException: In caso di errori durante l'elaborazione del file.
+        HTTPException: Se il file non è un TIFF valido con almeno 4 bande o in caso di errori durante l'elaborazione.
     """
     if not file.filename.lower().endswith(('.tif', '.tiff')):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tipo di file non valido. Sono amessi solo .tif e .tiff.")
@@ -131,26 +296,66 @@ async def compute_ndvi(file: UploadFile = File(...), token: dict = Depends(decod
     try:
         data = await file.read()
 
-        with MemoryFile(data) as memfile:
-            with memfile.open() as dataset:
-                if dataset.count < 4:
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Il file TIFF deve contenere almeno 4 bande (inclusi Red e NIR).")
-                
-                red_band = dataset.read(3).astype('float32')
-                nir_band = dataset.read(4).astype('float32')
+        # Il risultato dipende solo dal contenuto del file: un upload identico viene servito dalla cache
+        key = hashlib.blake2b(data, digest_size=16).digest()
+        result = ndvi_results.get(key)
 
-        ndvi = calculate_ndvi(red_band, nir_band)
-        png_buffer = ndvi_to_png_with_legend(ndvi)
+        if result is None:
+            # Il lavoro CPU-bound viene eseguito nel pool di processi per non bloccare l'event loop
+            loop = asyncio.get_running_loop()
+            mean_ndvi, png_bytes = await loop.run_in_executor(NDVI_POOL, process_tiff, data)
 
-        base64_png = png_to_base64(png_buffer)
-        description = ndvi_description(ndvi)
+            result = (ndvi_description(mean_ndvi), mean_ndvi, png_bytes)
+            # Un PNG più grande dell'intera cache non viene memorizzato
+            if len(png_bytes) <= NDVI_CACHE_MAX_BYTES:
+                ndvi_results[key] = result
 
-        return {
-            "filename": file.filename,
-            "description": description,
-            "mean_ndvi": float(np.nanmean(ndvi)),
-            "ndvi_image_base64": base64_png
-        }
+        return result
     
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Errore nell'elaborazione dell'immagine.")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Errore nell'elaborazione dell'immagine.")
+
+@app.post("/compute-ndvi")
+async def compute_ndvi(file: UploadFile = File(...), token: dict = Depends(decode_access_token)):
+    """
+    Calcola l'NDVI da un file TIFF caricato e restituisce l'immagine PNG codificata in base64 insieme a una descrizione testuale.
+    Args:
+        file (UploadFile): File TIFF caricato.
+        token (dict): Payload del token di accesso decodificato.
+    Returns:
+        dict: Dizionario contenente il nome del file, la descrizione, l'NDVI medio e l'immagine NDVI in formato base64.
+    Raises:
+        HTTPException: In caso di errori durante l'elaborazione del file.
+    """
+    description, mean_ndvi, png_bytes = await compute_ndvi_result(file)
+
+    return {
+        "filename": file.filename,
+        "description": description,
+        "mean_ndvi": mean_ndvi,
+        "ndvi_image_base64": png_to_base64(png_bytes)
+    }
+
+@app.post("/compute-ndvi/png")
+async def compute_ndvi_png(file: UploadFile = File(...), token: dict = Depends(decode_access_token)):
+    """
+    Calcola l'NDVI da un file TIFF caricato e restituisce direttamente l'immagine PNG, senza la codifica base64 nel JSON.
+    La descrizione, l'NDVI medio e il nome del file sono restituiti negli header della risposta (codificati per URL).
+    Args:
+        file (UploadFile): File TIFF caricato.
+        token (dict): Payload del token di accesso decodificato.
+    Returns:
+        Response: Immagine NDVI in formato PNG.
+    Raises:
+        HTTPException: In caso di errori durante l'elaborazione del file.
+    """
+    description, mean_ndvi, png_bytes = await compute_ndvi_result(file)
+
+    headers = {
+        "X-Mean-NDVI": f"{mean_ndvi:.4f}",
+        "X-Description": quote(description),
+        "X-Filename": quote(file.filename)
+    }
+    return Response(content=png_bytes, media_type="image/png", headers=headers)
\ No newline at end of file
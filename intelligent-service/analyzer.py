@@ -1,17 +1,100 @@
 from base import AnalysisStrategy, BaseContext
-from typing import Generic, TypeVar
+from typing import Any, Dict, Generic, Optional, TypeVar
+from cachetools import TTLCache
+import asyncio
+import hashlib
+import numpy as np
+import orjson
 
 # Definizione del tipo generico per il contesto di analisi.
 T = TypeVar('T', bound=BaseContext)
 
+class AnalysisCache:
+    """
+    Cache con scadenza dei risultati delle analisi, indicizzata per strategia e hash del payload.
+    Le richieste concorrenti con lo stesso payload attendono l'unica analisi in corso invece di ripeterla.
+    Va utilizzata solo con strategie il cui risultato dipende esclusivamente dal payload.
+    Attributes:
+        maxsize (int): Numero massimo di risultati in cache.
+        ttl (float): Tempo di vita dei risultati in secondi.
+        decimals (Optional[int]): Se indicato, gli array numpy del payload vengono arrotondati a questo numero di decimali
+            prima del calcolo della chiave, così payload quasi identici condividono lo stesso risultato.
+    """
+    def __init__(self, maxsize: int, ttl: float, decimals: Optional[int] = None):
+        self.results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.in_flight: Dict[tuple, asyncio.Future] = {}
+        self.decimals = decimals
+
+    def make_key(self, strategy: AnalysisStrategy, context: BaseContext) -> Optional[tuple]:
+        """
+        Calcola la chiave di cache dalla strategia e dal payload serializzato in JSON canonico (chiavi ordinate).
+        Args:
+            strategy (AnalysisStrategy): La strategia di analisi.
+            context (BaseContext): Il contesto di analisi.
+        Returns:
+            Optional[tuple]: La chiave di cache, oppure None se il payload non è serializzabile.
+        """
+        payload = context.payload
+        if self.decimals is not None:
+            # Il +0.0 normalizza gli zeri negativi prodotti dall'arrotondamento, che altrimenti darebbero chiavi diverse
+            payload = {key: np.round(value, self.decimals) + 0.0 if isinstance(value, np.ndarray) else value for key, value in payload.items()}
+
+        try:
+            payload = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            return None
+        return type(strategy), hashlib.blake2b(payload, digest_size=16).digest()
+
+    async def run(self, strategy: AnalysisStrategy, context: BaseContext) -> Any:
+        """
+        Restituisce il risultato in cache per il contesto, oppure esegue l'analisi e lo memorizza.
+        Args:
+            strategy (AnalysisStrategy): La strategia di analisi.
+            context (BaseContext): Il contesto di analisi.
+        Returns:
+            Any: Il risultato dell'analisi.
+        """
+        key = self.make_key(strategy, context)
+        if key is None:
+            return await strategy.analyze(context)
+
+        result = self.results.get(key)
+        if result is not None:
+            return result
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await strategy.analyze(context)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # L'eccezione viene marcata come letta, così non viene segnalata se nessun'altra richiesta la attende
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+        self.results[key] = result
+        future.set_result(result)
+        return result
+
 class IntelligentAnalyzer(Generic[T]):
     """
     Analizzatore intelligente che utilizza una strategia di analisi specifica.
     Attributes:
         strategy (AnalysisStrategy[T]): La strategia di analisi da utilizzare.
+        cache (Optional[AnalysisCache]): Cache dei risultati, da fornire solo per strategie che dipendono unicamente dal payload.
     """
-    def __init__(self, strategy: AnalysisStrategy[T]):
+    def __init__(self, strategy: AnalysisStrategy[T], cache: Optional[AnalysisCache] = None):
         self.strategy = strategy
+        self.cache = cache
 
     async def execute(self, context: T):
         """
@@ -21,4 +104,6 @@ class IntelligentAnalyzer(Generic[T]):
         Returns:
             Il risultato dell'analisi.
         """
-        return await self.strategy.analyze(context)
\ No newline at end of file
+        if self.cache is not None:
+            return await self.cache.run(self.strategy, context)
+        return await self.strategy.analyze(context)
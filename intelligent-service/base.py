@@ -1,15 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Any, Generic, TypeVar
+from typing import Any, Generic, Mapping, TypeVar
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(frozen=True)
 class BaseContext:
     """
     Contesto di base per l'analisi intelligente.
+    I contesti sono immutabili e usano __slots__ per non allocare un __dict__ per ogni istanza.
     Attributes:
-        payload (dict): I dati da analizzare.
+        payload (Mapping[str, Any]): I dati da analizzare.
     """
-    payload: dict
+    __slots__ = ("payload",)
+
+    payload: Mapping[str, Any]
 
 # Definizione del tipo generico per il contesto di analisi.
 T = TypeVar('T', bound=BaseContext)
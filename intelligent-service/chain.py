@@ -1,102 +1,128 @@
-from dataclasses import dataclass
-from typing import Any, Dict, Optional, List
-from abc import ABC, abstractmethod
-from sqlalchemy.ext.asyncio import AsyncSession
+from types import MappingProxyType
+from typing import Any, Dict, Optional, Protocol, Sequence
 import numpy as np
 from analyzer import IntelligentAnalyzer
 from contexts import MLAnalysisContext
 from field_service_client import FieldServiceClient
 from httpx import HTTPStatusError
+import logging
+import orjson
+from sensor_stats import sensor_means
+
+# Logger del modulo: i messaggi di debug della chain vengono formattati solo se il livello DEBUG è abilitato
+logger = logging.getLogger(__name__)
+
+# Consigli associati a ciascuna etichetta prevista dal modello, costruiti una sola volta e in sola lettura
+ADVICE_MAP = MappingProxyType({
+    "Ottimale": "Le condizioni sono ideali. Mantieni il monitoraggio regolare senza interventi.",
+    "Pericolo: Stress Idrico Severo": "URGENTE: Irrigare immediatamente. La pianta è in grave sofferenza. Considera di ombreggiare temporaneamente se il sole è diretto.",
+    "Attenzione: Carenza Acqua": "Il terreno si sta asciugando troppo. Pianifica un ciclo di irrigazione nelle prossime ore, preferibilmente al tramonto o all'alba.",
+    "Rischio: Malattie Fungine": "Umidità e calore eccessivi. Sospendi l'irrigazione fogliare, migliora la ventilazione e considera un trattamento preventivo antifungino.",
+    "Attenzione: Rischio Gelata": "Temperature critiche. Proteggi le piante con tessuto non tessuto (TNT) o pacciamatura e sospendi le irrigazioni serali.",
+    "Attenzione: Ristagno Idrico": "Troppa acqua nel terreno! Interrompi immediatamente l'irrigazione. Verifica il drenaggio per evitare marciumi radicali."
+})
 
 # Contesto per la chain di analisi
-@dataclass
 class MLAnalysisChainContext:
     """
     Contesto per la catena di analisi ML.
     Contiene i dati necessari per ogni fase della catena e i risultati intermedi.
+    Gli attributi sono dichiarati in __slots__, per cui le istanze non allocano un __dict__.
 
     Attributes:
         payload (dict): Dati di input per la catena, inclusi field, sensor_types e window_size.
         token (Optional[str]): Token JWT per l'autenticazione con field-service.
-        raw_readings (Optional[Dict[str, List[float]]]): Letture grezze dei sensori.
-        statistics (Optional[List[float]]): Statistiche calcolate dalle letture.
+        sensor_types (tuple): Tipi di sensori richiesti, normalizzati dal payload una sola volta all'inizio della catena.
+        n_sensors (int): Numero di tipi di sensori richiesti.
+        raw_readings (Optional[Dict[str, np.ndarray]]): Letture grezze dei sensori, come array float64 per tipo di sensore.
+        statistics (Optional[np.ndarray]): Statistiche calcolate dalle letture.
         features (Optional[np.array]): Feature costruite per l'inferenza ML.
         prediction (Optional[str]): Risultato della previsione ML.
         confidence_score (Optional[float]): Punteggio di confidenza della previsione.
         advice (Optional[str]): Consigli generati in base alla previsione.
         stop (bool): Flag per interrompere la catena se necessario.
     """
+    __slots__ = (
+        "payload", "token", "sensor_types", "n_sensors", "raw_readings", "statistics",
+        "features", "prediction", "confidence_score", "advice", "stop"
+    )
+
+    def __init__(self, payload: dict[str, Any], token: Optional[str] = None):
+        # payload che contiene gli identificatori necessari (field, sensor_types, window_size)
+        self.payload = payload
 
-    # payload che contiene gli identificatori necessari (field, sensor_types, window_size)
-    payload: dict[str, Any]
+        # token jwt per l'autenticazione con field-service
+        self.token = token
 
-    # token jwt per l'autenticazione con field-service
-    token: Optional[str] = None
+        # tipi di sensori letti dal payload dal primo handler e condivisi con i successivi
+        self.sensor_types: tuple = ()
+        self.n_sensors: int = 0
 
-    # campi popolati durante la chain dagli handler
-    raw_readings: Optional[Dict[str, List[float]]] = None
-    statistics: Optional[List[float]] = None
-    features: Optional[np.array] = None
-    prediction: Optional[str] = None
-    confidence_score: Optional[float] = None
-    advice: Optional[str] = None
+        # campi popolati durante la chain dagli handler
+        self.raw_readings: Optional[Dict[str, np.ndarray]] = None
+        self.statistics: Optional[np.ndarray] = None
+        self.features: Optional[np.array] = None
+        self.prediction: Optional[str] = None
+        self.confidence_score: Optional[float] = None
+        self.advice: Optional[str] = None
 
-    # flag che permette di interrompere la catena se necessario
-    stop: bool = False
+        # flag che permette di interrompere la catena se necessario
+        self.stop: bool = False
 
 # Interfaccia per gli handler della chain
-class ChainHandler(ABC):
+class ChainHandler(Protocol):
     """
-    Interfaccia astratta per gli handler della catena.
-    Ogni handler deve implementare il metodo handle per processare il contesto.
+    Interfaccia strutturale per gli handler della catena.
+    Ogni handler deve implementare il metodo handle per processare il contesto; l'esecuzione
+    dell'handler successivo è gestita dalla ChainPipeline.
     """
-    def __init__(self):
-        self.next_handler: Optional['ChainHandler'] = None
-    
-    def set_next(self, handler: 'ChainHandler') -> 'ChainHandler':
-        """
-        Imposta il prossimo handler nella catena.
-        Args:
-            handler (ChainHandler): Il prossimo handler da eseguire.
-        Returns:
-            ChainHandler: Il prossimo handler.
-        """
-        self.next_handler = handler
-        return handler
-    
-    async def call_next(self, context: MLAnalysisChainContext) -> MLAnalysisChainContext:
+    async def handle(self, context: MLAnalysisChainContext) -> MLAnalysisChainContext:
         """
-        Chiama il prossimo handler nella catena se esiste e se il flag stop non è impostato.
+        Processa il contesto.
         Args:
-            context (MLAnalysisChainContext): Il contesto da passare al prossimo handler.
+            context (MLAnalysisChainContext): Il contesto da processare.
         Returns:
-            MLAnalysisChainContext: Il contesto dopo l'elaborazione del prossimo handler.
+            MLAnalysisChainContext: Il contesto dopo l'elaborazione.
         """
-        if self.next_handler and not context.stop:
-            return await self.next_handler.handle(context)
-        return context
-    
-    @abstractmethod
+        ...
+
+class ChainPipeline:
+    """
+    Esegue in sequenza gli handler della catena, interrompendosi quando un handler imposta il flag stop.
+    I metodi handle degli handler sono risolti una sola volta alla costruzione della pipeline.
+    Args:
+        handlers (Sequence[ChainHandler]): Gli handler della catena, nell'ordine di esecuzione.
+    """
+    __slots__ = ("steps",)
+
+    def __init__(self, handlers: Sequence[ChainHandler]):
+        self.steps = tuple(handler.handle for handler in handlers)
+
     async def handle(self, context: MLAnalysisChainContext) -> MLAnalysisChainContext:
         """
-        Metodo astratto per processare il contesto.
+        Esegue gli handler della catena sul contesto.
         Args:
             context (MLAnalysisChainContext): Il contesto da processare.
         Returns:
-            MLAnalysisChainContext: Il contesto dopo l'elaborazione.
+            MLAnalysisChainContext: Il contesto dopo l'elaborazione dell'ultimo handler eseguito.
         """
-        pass
+        for step in self.steps:
+            context = await step(context)
+            if context.stop:
+                break
+        return context
 
 # Handler concreti della chain
-class DataFetchHandler(ChainHandler):
+class DataFetchHandler:
     """
     Handler per il recupero delle letture dei sensori dal field-service.
     Args:
         field_service (FieldServiceClient): Client per interagire con il field-service.
         max_items (int): Numero massimo di letture da recuperare per sensore.
     """
+    __slots__ = ("field_service", "max_items")
+
     def __init__(self, field_service: FieldServiceClient, max_items: int = 50):
-        super().__init__()
         self.field_service = field_service
         self.max_items = max_items
     
@@ -109,12 +135,13 @@ class DataFetchHandler(ChainHandler):
             MLAnalysisChainContext: Il contesto aggiornato con le letture dei sensori.
         """
         field = context.payload.get("field")
-        sensor_types = context.payload.get("sensor_types", [])
+        sensor_types = context.sensor_types = tuple(context.payload.get("sensor_types", ()))
+        context.n_sensors = len(sensor_types)
         window_size = context.payload.get("window_size", self.max_items)
         token = context.token
 
         if context.raw_readings:
-            return await self.call_next(context)
+            return context
         
         if not field or not sensor_types:
             raise ValueError("Field e sensor_types sono obbligatori nel payload.")
@@ -133,36 +160,44 @@ class DataFetchHandler(ChainHandler):
                 context.stop = True
                 return context
             
+            # I valori vengono letti direttamente in array NumPy, senza costruire liste intermedie
             normalized_readings = {}
             for sensor_type, db_readings in readings.items():
                 if isinstance(db_readings, list):
-                    normalized_readings[sensor_type] = [reading['value'] for reading in db_readings if isinstance(reading, dict) and "value" in reading]
+                    normalized_readings[sensor_type] = np.fromiter(
+                        (reading['value'] for reading in db_readings if type(reading) is dict and "value" in reading), dtype=np.float64
+                    )
                 else:
-                    normalized_readings[sensor_type] = []
+                    normalized_readings[sensor_type] = np.empty(0, dtype=np.float64)
             
             context.raw_readings = normalized_readings
         
         except HTTPStatusError as http_err:
             context.raw_readings = {}
-            error_detail = http_err.response.json().get("detail", "Errore sconosciuto.")
+            try:
+                error_detail = orjson.loads(http_err.response.content).get("detail", "Errore sconosciuto.")
+            except orjson.JSONDecodeError:
+                error_detail = "Errore sconosciuto."
             context.prediction = f"Errore durante il recupero delle letture: {error_detail}"
             context.stop = True
             return context
         
         except Exception as e:
-            print(f"Errore durante il recupero delle letture dei sensori: {e}")
+            logger.exception("Errore durante il recupero delle letture dei sensori: %s", e)
             context.raw_readings = {}
             context.prediction = "Errore nel recupero delle letture dei sensori."
             context.stop = True
             return context
         
-        return await self.call_next(context)
+        return context
 
-class FeatureExtractionHandler(ChainHandler):
+class FeatureExtractionHandler:
     """
     Handler per l'estrazione delle feature dalle letture dei sensori.
-    Calcola statistiche semplici (media) per ogni tipo di sensore.
+    Calcola statistiche semplici (media) per ogni tipo di sensore con operazioni vettoriali NumPy.
     """
+    __slots__ = ()
+
     async def handle(self, context: MLAnalysisChainContext) -> MLAnalysisChainContext:
         """
         Estrae le feature dalle letture dei sensori calcolando la media per ogni tipo di sensore.
@@ -173,41 +208,41 @@ class FeatureExtractionHandler(ChainHandler):
         """
         try:
             raw_readings = context.raw_readings
-            sensor_types = context.payload.get("sensor_types", [])
+            sensor_types = context.sensor_types
 
             if not raw_readings:
                 context.prediction = "Nessuna lettura disponibile per l'estrazione delle feature."
                 context.stop = True
                 return context
             
-            statistics = []
-            missing_sensors = []
-            for sensor_type in sensor_types:
-                readings = raw_readings.get(sensor_type, [])
-                if readings and len(readings) > 0:
-                    statistics.append(sum(readings) / len(readings))
-                else:
-                    missing_sensors.append(sensor_type)
-                    statistics.append(0.0)
+            missing_sensors = [sensor_type for sensor_type in sensor_types if len(raw_readings.get(sensor_type, ())) == 0]
             
             if missing_sensors:
                 context.prediction = f"Letture mancanti per i seguenti tipi di sensori: {', '.join(missing_sensors)}"
                 context.stop = True
                 return context
 
-            context.statistics = statistics
+            # Le letture dei sensori vengono concatenate in un unico array, delimitato dagli offset di ciascun sensore,
+            # e le medie sono calcolate con un'unica riduzione vettoriale
+            lengths = np.fromiter((len(raw_readings[sensor_type]) for sensor_type in sensor_types), dtype=np.int64, count=context.n_sensors)
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+            values = np.concatenate([raw_readings[sensor_type] for sensor_type in sensor_types])
+
+            context.statistics = sensor_means(values, offsets)
         except Exception as e:
             context.prediction = "Errore durante l'estrazione delle feature."
             context.stop = True
             return context
 
-        return await self.call_next(context)
+        return context
 
-class InputConstructionHandler(ChainHandler):
+class InputConstructionHandler:
     """
     Handler per la costruzione dell'input per l'inferenza ML.
-    Trasforma le statistiche in un array numpy adatto per il modello ML.
+    Trasforma le statistiche in un array numpy float32, il tipo con cui il modello (Random Forest) valuta le feature.
     """
+    __slots__ = ()
+
     async def handle(self, context: MLAnalysisChainContext) -> MLAnalysisChainContext:
         """
         Costruisce l'input per l'inferenza ML trasformando le statistiche in un array numpy.
@@ -216,30 +251,32 @@ class InputConstructionHandler(ChainHandler):
         Returns:
             MLAnalysisChainContext: Il contesto aggiornato con le feature costruite."""
         statistics = context.statistics
-        if not statistics or len(statistics) == 0:
+        if statistics is None or len(statistics) == 0:
             context.prediction = "Statistiche non disponibili per la costruzione delle feature."
             context.stop = True
             return context
 
         try:
-            features = statistics
-            context.features = np.array(features).reshape(1, -1)
+            # Gli alberi di scikit-learn convertono comunque l'input in float32: la conversione avviene qui una sola volta
+            # invece che a ogni chiamata di predict e predict_proba
+            context.features = statistics.astype(np.float32).reshape(1, -1)
         except Exception as e:
             context.prediction = "Errore durante la costruzione delle feature."
             context.stop = True
             return context
 
-        return await self.call_next(context)
+        return context
 
-class MLInferenceHandler(ChainHandler):
+class MLInferenceHandler:
     """
     Handler per l'inferenza del modello ML.
     Utilizza l'IntelligentAnalyzer per ottenere la previsione basata sulle feature.
     Args:
         analyzer (IntelligentAnalyzer): Analizzatore intelligente per l'inferenza ML.
     """
+    __slots__ = ("analyzer",)
+
     def __init__(self, analyzer: IntelligentAnalyzer):
-        super().__init__()
         self.analyzer = analyzer
     
     async def handle(self, context: MLAnalysisChainContext) -> MLAnalysisChainContext:
@@ -258,24 +295,24 @@ class MLInferenceHandler(ChainHandler):
         
         try:
             prediction = await self.analyzer.execute(MLAnalysisContext(payload={"features": features}))
-            print("Prediction result:", prediction)
-            print("Prediction type:", type(prediction))
-            context.prediction = prediction.get("label", "N/A")
-            context.confidence_score = prediction.get("confidence", 0.0)
+            logger.debug("Prediction result: %s", prediction)
+            context.prediction, context.confidence_score = prediction
         except Exception as e:
-            print(f"Errore durante l'inferenza del modello: {e}")
+            logger.exception("Errore durante l'inferenza del modello: %s", e)
             context.prediction = "Errore durante l'inferenza del modello."
             context.confidence_score = 0.0
             context.stop = True
             return context
         
-        return await self.call_next(context)
+        return context
 
-class AdviceGenerationHandler(ChainHandler):
+class AdviceGenerationHandler:
     """
     Handler per la generazione dei consigli basati sulla previsione ML.
     Mappa le etichette di previsione a consigli specifici per l'utente.
     """
+    __slots__ = ()
+
     async def handle(self, context: MLAnalysisChainContext) -> MLAnalysisChainContext:
         """
         Genera consigli basati sulla previsione ML.
@@ -289,33 +326,24 @@ class AdviceGenerationHandler(ChainHandler):
             context.advice = "Nessuna previsione disponibile per generare consigli."
             return context
         
-        advice_map = {
-            "Ottimale": "Le condizioni sono ideali. Mantieni il monitoraggio regolare senza interventi.",
-            "Pericolo: Stress Idrico Severo": "URGENTE: Irrigare immediatamente. La pianta è in grave sofferenza. Considera di ombreggiare temporaneamente se il sole è diretto.",
-            "Attenzione: Carenza Acqua": "Il terreno si sta asciugando troppo. Pianifica un ciclo di irrigazione nelle prossime ore, preferibilmente al tramonto o all'alba.",
-            "Rischio: Malattie Fungine": "Umidità e calore eccessivi. Sospendi l'irrigazione fogliare, migliora la ventilazione e considera un trattamento preventivo antifungino.",
-            "Attenzione: Rischio Gelata": "Temperature critiche. Proteggi le piante con tessuto non tessuto (TNT) o pacciamatura e sospendi le irrigazioni serali.",
-            "Attenzione: Ristagno Idrico": "Troppa acqua nel terreno! Interrompi immediatamente l'irrigazione. Verifica il drenaggio per evitare marciumi radicali."
-        }
-        context.advice = advice_map.get(prediction, "Nessun consiglio disponibile per questa previsione.")
-
-        return await self.call_next(context)
+        context.advice = ADVICE_MAP.get(prediction, "Nessun consiglio disponibile per questa previsione.")
+
+        return context
 
 # Builder della chain
-def build_ml_chain(analyzer: IntelligentAnalyzer, field_service: FieldServiceClient) -> ChainHandler:
+def build_ml_chain(analyzer: IntelligentAnalyzer, field_service: FieldServiceClient) -> ChainPipeline:
     """
     Costruisce la catena di handler per l'analisi ML.
     Args:
         analyzer (IntelligentAnalyzer): Analizzatore intelligente per l'inferenza ML.
         field_service (FieldServiceClient): Client per interagire con il field-service.
     Returns:
-        ChainHandler: Il primo handler della catena.
+        ChainPipeline: La pipeline che esegue in sequenza gli handler della catena.
     """
-    data_fetch_handler = DataFetchHandler(field_service=field_service)
-    feature_extraction_handler = FeatureExtractionHandler()
-    input_construction_handler = InputConstructionHandler()
-    ml_inference_handler = MLInferenceHandler(analyzer=analyzer)
-    advice_generation_handler = AdviceGenerationHandler()
-
-    data_fetch_handler.set_next(feature_extraction_handler).set_next(input_construction_handler).set_next(ml_inference_handler).set_next(advice_generation_handler)
-    return data_fetch_handler
\ No newline at end of file
+    return ChainPipeline((
+        DataFetchHandler(field_service=field_service),
+        FeatureExtractionHandler(),
+        InputConstructionHandler(),
+        MLInferenceHandler(analyzer=analyzer),
+        AdviceGenerationHandler()
+    ))
\ No newline at end of file
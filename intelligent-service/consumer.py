@@ -1,15 +1,30 @@
 from aio_pika import connect_robust, IncomingMessage, ExchangeType, Message
 from database import AsyncSessionLocal
-import json
+import asyncio
+import logging
+import orjson
 import redis.asyncio as aioredis
-from redis.asyncio.connection import ConnectionPool
 from analyzer import IntelligentAnalyzer
 from contexts import RuleAnalysisContext
 from models import Alert
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone
+from typing import Optional
 
 ROUTING_KEY_PREFIX = "alerts."
 
+COPY_THRESHOLD = 100 # Numero di alert di un messaggio oltre il quale l'inserimento avviene con COPY invece che con INSERT
+
+# INSERT Core sulla tabella degli alert: gli alert sono solo scritti, per cui non passano dall'unit of work dell'ORM
+ALERT_INSERT = insert(Alert.__table__)
+
+# Colonne della tabella degli alert scritte dal consumer con COPY, nell'ordine dei valori dei record
+ALERT_COLUMNS = ("sensor_type", "message", "timestamp", "active", "field", "owner_id")
+
+# Logger del modulo: i messaggi per singolo messaggio sono di livello DEBUG e non vengono formattati se il livello è disabilitato
+logger = logging.getLogger(__name__)
+
 class RabbitMQIntelligentConsumer:
     """
     Consumer RabbitMQ per l'analisi intelligente dei messaggi.
@@ -21,30 +36,31 @@ class RabbitMQIntelligentConsumer:
         queue_name (str): Nome della coda da cui consumare i messaggi.
         alerts_exchange_name (str): Nome dell'exchange per pubblicare gli alert.
         analyzer (IntelligentAnalyzer): Istanza di IntelligentAnalyzer per l'analisi dei messaggi.
-        redis_url (str): URL di connessione a Redis.
-        redis_max_connections (int): Numero massimo di connessioni Redis.
+        redis (Optional[aioredis.Redis]): Client Redis condiviso con l'applicazione, gestito e chiuso da chi lo crea.
+        prefetch_count (int): Numero massimo di messaggi non confermati elaborati contemporaneamente.
     """
-    def __init__(self, rabbitmq_url: str, queue_name: str, alerts_exchange_name: str, analyzer: IntelligentAnalyzer, redis_url: str, redis_max_connections: int = 20):
+    def __init__(self, rabbitmq_url: str, queue_name: str, alerts_exchange_name: str, analyzer: IntelligentAnalyzer, redis: Optional[aioredis.Redis], prefetch_count: int = 50):
         self.rabbitmq_url = rabbitmq_url
         self.queue_name = queue_name
         self.alerts_exchange_name = alerts_exchange_name
-        self.redis_url = redis_url
-        self.redis_max_connections = redis_max_connections
         self.connection = None
         self.channel = None
         self.queue = None
-        self.redis = None
+        self.redis = redis
+        self.prefetch_count = prefetch_count
         self.alerts_exchange = None
         self.analyzer = analyzer
+        # Routing key degli alert per campo, costruite una sola volta: i campi distinti sono pochi rispetto ai messaggi
+        self.routing_keys: dict[str, str] = {}
 
     async def connect(self):
         """
-        Stabilisce la connessione a RabbitMQ e Redis, e prepara la coda e l'exchange.
+        Stabilisce la connessione a RabbitMQ e prepara la coda e l'exchange.
         """
         self.connection = await connect_robust(self.rabbitmq_url)
         self.channel = await self.connection.channel()
 
-        await self.channel.set_qos(prefetch_count=10)
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
 
         self.queue = await self.channel.declare_queue(self.queue_name, durable=True)
 
@@ -52,11 +68,31 @@ class RabbitMQIntelligentConsumer:
 
         await self.queue.consume(self.handle_message)
 
-        try:
-            pool = ConnectionPool.from_url(self.redis_url, max_connections=self.redis_max_connections)
-            self.redis = aioredis.Redis(decode_responses=True, connection_pool=pool)
-        except Exception:
-            self.redis = None
+    def routing_key(self, field: str) -> str:
+        """
+        Restituisce la routing key con cui pubblicare gli alert del campo indicato.
+        Args:
+            field (str): Il campo a cui si riferisce l'alert.
+        Returns:
+            str: La routing key dell'alert.
+        """
+        routing_key = self.routing_keys.get(field)
+        if routing_key is None:
+            routing_key = self.routing_keys[field] = ROUTING_KEY_PREFIX + field
+        return routing_key
+
+    async def copy_alerts(self, db: AsyncSession, rows: list[dict]):
+        """
+        Inserisce gli alert con un'unica COPY sulla connessione asyncpg della sessione, evitando il parsing SQL di ogni riga.
+        Args:
+            db (AsyncSession): La sessione del database in cui eseguire l'inserimento.
+            rows (list[dict]): Le righe degli alert, con una chiave per ciascuna colonna di ALERT_COLUMNS.
+        """
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            Alert.__tablename__, records=[tuple(row[column] for column in ALERT_COLUMNS) for row in rows], columns=ALERT_COLUMNS
+        )
 
     async def handle_message(self, message: IncomingMessage):
         """
@@ -65,10 +101,16 @@ class RabbitMQIntelligentConsumer:
         Args:
             message (IncomingMessage): Messaggio ricevuto dalla coda."""
         async with message.process(requeue=True):
+            # Il payload viene decodificato prima di occupare una connessione del pool. Un messaggio non decodificabile
+            # non diventerebbe valido con una nuova consegna, per cui viene confermato e scartato invece di essere rimesso in coda
+            try:
+                payload = orjson.loads(message.body)
+            except orjson.JSONDecodeError as e:
+                logger.exception("Messaggio non valido scartato: %s", e)
+                return
+
             async with AsyncSessionLocal() as db:
                 try:
-                    payload = json.loads(message.body.decode())
-
                     analysis_context = RuleAnalysisContext(
                         payload=payload,
                         db=db,
@@ -76,47 +118,57 @@ class RabbitMQIntelligentConsumer:
                     )
                     alerts = await self.analyzer.execute(analysis_context)
                     if alerts:
-                        print(f"Alerts generated for payload {payload}: {alerts}")
+                        logger.debug("Alerts generated for payload %s: %s", payload, alerts)
 
                         now = datetime.now(timezone.utc)
 
-                        # Scrivi su coda e salva nel DB
+                        # Scrivi su coda e salva nel DB. Righe e messaggi vengono preparati in un unico passaggio sugli alert;
+                        # i messaggi sono pubblicati solo dopo il commit, così non vengono mai notificati alert non salvati
+                        rows = []
+                        publications = []
                         for alert in alerts:
-                            alert['timestamp'] = now.isoformat()
-                            db.add(Alert(
-                                sensor_type=alert['sensor_type'],
-                                message=alert['message'],
-                                timestamp=now,
-                                active=True,
-                                field=alert['field'],
-                                owner_id=alert['owner_id']
-                            ))
+                            field = alert['field']
+                            # orjson serializza il datetime in formato ISO 8601 durante la pubblicazione
+                            alert['timestamp'] = now
+                            rows.append({
+                                "sensor_type": alert['sensor_type'],
+                                "message": alert['message'],
+                                "timestamp": now,
+                                "active": True,
+                                "field": field,
+                                "owner_id": alert['owner_id']
+                            })
+                            publications.append((Message(orjson.dumps(alert)), self.routing_key(field)))
                         try:
+                            # Il commit resta sincrono: il messaggio viene confermato solo all'uscita da message.process,
+                            # quindi dopo che gli alert sono stati scritti su disco, e un crash del database non li perde senza riconsegna
+                            # Gli alert vengono inseriti con un'unica INSERT multi-riga invece di un'INSERT per alert,
+                            # oppure con COPY quando un messaggio ne genera molti
+                            if len(rows) >= COPY_THRESHOLD:
+                                await self.copy_alerts(db, rows)
+                            else:
+                                await db.execute(ALERT_INSERT, rows)
                             await db.commit()
                         except Exception as e:
                             await db.rollback()
-                            print(f"Errore nel commit del DB: {e}")
+                            logger.exception("Errore nel commit del DB: %s", e)
                             raise e
                         
-                        for alert in alerts:
-                            routing_key = f"{ROUTING_KEY_PREFIX}{alert['field']}"
-
-                            alert_message_body = json.dumps(alert).encode()
-                            alert_message = Message(alert_message_body)
-                            await self.alerts_exchange.publish(alert_message, routing_key=routing_key)
-
-                            print(f"Alert pubbliacto su RabbitMQ con routing key {routing_key}: {alert}")
+                        # Le pubblicazioni vengono avviate insieme e condividono il canale, invece di attendere ciascuna in sequenza
+                        await asyncio.gather(*(
+                            self.alerts_exchange.publish(alert_message, routing_key=routing_key)
+                            for alert_message, routing_key in publications
+                        ))
 
+                        logger.debug("%d alert pubblicati su RabbitMQ", len(alerts))
 
                 except Exception as e:
-                    print(f"Errore nel processing del messaggio: {e}")
+                    logger.exception("Errore nel processing del messaggio: %s", e)
                     raise e
     
     async def close(self):
         """
-        Chiude le connessioni a RabbitMQ e Redis.
+        Chiude la connessione a RabbitMQ. Il client Redis condiviso viene chiuso dall'applicazione.
         """
-        if self.redis:
-            await self.redis.close()
         if self.connection:
             await self.connection.close()
\ No newline at end of file
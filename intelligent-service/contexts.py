@@ -1,23 +1,47 @@
 from dataclasses import dataclass
+from typing import TypedDict
 from sqlalchemy.ext.asyncio import AsyncSession
+import numpy as np
 import redis.asyncio as aioredis
 from base import BaseContext
 
+class RulePayload(TypedDict, total=False):
+    """
+    Lettura di un sensore ricevuta dalla coda e valutata rispetto alle regole del campo.
+    """
+    sensor_id: str
+    field_id: str
+    sensor_type: str
+    value: float
+    unit: str
+    timestamp: str
+
+class MLPayload(TypedDict):
+    """
+    Dati di input del modello di machine learning.
+    """
+    features: np.ndarray
+
 # Contesto per la rule analysis
-@dataclass
+@dataclass(frozen=True)
 class RuleAnalysisContext(BaseContext):
     """
     Contesto per l'analisi delle regole.
     Contiene la sessione del database asincrona e la connessione Redis.
     """
+    __slots__ = ("db", "redis")
+
+    payload: RulePayload
     db: AsyncSession
     redis: aioredis.Redis
 
 # Contesto per il modello di ML
-@dataclass
+@dataclass(frozen=True)
 class MLAnalysisContext(BaseContext):
     """
     Contesto per l'analisi del modello di machine learning.
     Contiene il payload con i dati necessari per l'analisi.
     """
-    pass
\ No newline at end of file
+    __slots__ = ()
+
+    payload: MLPayload
@@ -10,8 +10,12 @@ DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20")) # Numero di connessioni al database mantenute nel pool
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1" # Registra ogni istruzione SQL eseguita, da abilitare solo in sviluppo
+DB_MAX_OVERFLOW = 20 # Connessioni aggiuntive aperte oltre il pool nei picchi, quando tutti i messaggi in prefetch sono in elaborazione
+
 # Crea l'engine di connessione al database
-engine = create_async_engine(DATABASE_URL, echo=True, pool_size=20)
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
 
 # Crea una sessione asincrona
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
@@ -1,13 +1,29 @@
+from typing import Optional
+import asyncio
+import hashlib
+import logging
 import httpx
+import orjson
+import redis.asyncio as aioredis
+
+READINGS_CACHE_TTL = 2 # Tempo di vita in secondi delle letture dei sensori in cache, breve per non restituire dati superati
+
+# Logger del modulo: gli errori della cache Redis non interrompono il recupero delle letture
+logger = logging.getLogger(__name__)
 
 class FieldServiceClient:
     """
     Client per interagire con il servizio field-service.
+    Le richieste concorrenti con gli stessi parametri attendono un'unica chiamata HTTP, e le letture
+    recuperate vengono mantenute brevemente in Redis per le richieste successive.
     Attributes:
         client (httpx.AsyncClient): Istanza di httpx.AsyncClient per effettuare le richieste al servizio field-service
+        redis (Optional[aioredis.Redis]): Client Redis per la cache delle letture (opzionale)
     """
-    def __init__(self, client: httpx.AsyncClient):
+    def __init__(self, client: httpx.AsyncClient, redis: Optional[aioredis.Redis] = None):
         self.client = client
+        self.redis = redis
+        self.in_flight: dict[tuple, asyncio.Future] = {}
     
     async def get_latest_readings(self, field: str, sensor_types: list[str], window_size: int, token: str) -> list[dict]:
         """
@@ -20,14 +36,70 @@ class FieldServiceClient:
         Returns:
             Lista di dizionari contenenti le letture dei sensori
         """
+        # Il token fa parte della chiave: le letture sono condivise solo tra richieste dello stesso utente autenticato
+        token_hash = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+        key = (token_hash, field, tuple(sorted(sensor_types)), window_size)
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            readings = await self.fetch_latest_readings(key, field, sensor_types, window_size, token)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # L'eccezione viene marcata come letta, così non viene segnalata se nessun'altra richiesta la attende
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+        future.set_result(readings)
+        return readings
+
+    async def fetch_latest_readings(self, key: tuple, field: str, sensor_types: list[str], window_size: int, token: str) -> list[dict]:
+        """
+        Recupera le letture dalla cache Redis oppure, se assenti, dal field-service, salvandole in cache.
+        Args:
+            key (tuple): Chiave della richiesta, composta da hash del token, campo, tipi di sensori ordinati e numero di letture
+            field (str): Nome del campo da cui recuperare le letture
+            sensor_types (list[str]): Lista dei tipi di sensori di cui recuperare le letture
+            window_size (int): Numero massimo di letture da recuperare per ogni tipo di sensore
+            token (str): Token di autorizzazione jwt Bearer
+        Returns:
+            Lista di dizionari contenenti le letture dei sensori
+        """
+        token_hash, _, sorted_types, _ = key
+        cache_key = f"readings:{token_hash}:{field}:{','.join(sorted_types)}:{window_size}"
+
+        if self.redis:
+            try:
+                cached_readings = await self.redis.get(cache_key)
+                if cached_readings:
+                    return orjson.loads(cached_readings)
+            except Exception:
+                logger.warning("Errore nel recupero delle letture dalla cache.")
+
+        # Tutti i tipi di sensori sono richiesti con un'unica chiamata: il field-service li recupera con una sola query
         url = f"/fields/{field}/specific-types-readings"
         headers = {"Authorization": f"Bearer {token}"}
         params = {
             "sensor_types": sensor_types,
             "limit": window_size
         }
-        
-        
+
         response = await self.client.get(url, headers=headers, params=params)
         response.raise_for_status()
-        return response.json()
\ No newline at end of file
+
+        if self.redis:
+            try:
+                await self.redis.set(cache_key, response.content, ex=READINGS_CACHE_TTL)
+            except Exception:
+                logger.warning("Errore nel salvataggio delle letture nella cache.")
+
+        return orjson.loads(response.content)
@@ -1,7 +1,22 @@
 from base import AnalysisStrategy
 from contexts import MLAnalysisContext
+from typing import Any, Dict, List, NamedTuple, Optional
+import asyncio
 import numpy as np
 
+BATCH_MAX_SIZE = 64 # Numero massimo di vettori di feature valutati dal modello in un'unica chiamata
+BATCH_MAX_WAIT_MS = 5 # Tempo massimo in millisecondi di attesa di altre richieste prima di valutare il batch
+
+class Prediction(NamedTuple):
+    """
+    Risultato di una previsione del modello di machine learning.
+    Attributes:
+        label (str): L'etichetta prevista.
+        confidence (float): Il punteggio di confidenza della previsione.
+    """
+    label: str
+    confidence: float
+
 class MLStrategy(AnalysisStrategy):
     """
     Strategia di analisi basata su modelli di machine learning.
@@ -13,17 +28,16 @@ class MLStrategy(AnalysisStrategy):
     def __init__(self, model):
         self.model = model
 
-    async def analyze(self, context: MLAnalysisContext):
+    def prepare_features(self, features: Any) -> np.ndarray:
         """
-        Esegue l'analisi utilizzando il modello di machine learning.
+        Valida le feature e le trasforma in una matrice con una sola riga.
         Args:
-            context (MLAnalysisContext): Il contesto contenente i dati per l'analisi.
+            features (Any): Le feature fornite nel payload, come lista o array numpy.
         Returns:
-            dict: Un dizionario contenente l'etichetta prevista e il punteggio di confidenza.
+            np.ndarray: Le feature con forma (1, N).
         Raises:
-            ValueError: Se le feature non sono fornite o sono vuote."""
-        features = context.payload["features"]
-
+            ValueError: Se le feature non sono fornite o sono vuote.
+        """
         if features is None:
             raise ValueError("Features non fornite per l'analisi ML.")
         
@@ -36,15 +50,135 @@ class MLStrategy(AnalysisStrategy):
             if features.ndim == 1:
                 features = features.reshape(1, -1)
 
-        result = self.model.predict(features)[0]
+        return features
+
+    def predict_batch(self, features: np.ndarray) -> List[Prediction]:
+        """
+        Valuta con il modello una matrice di feature, una riga per richiesta, con una sola chiamata a predict e predict_proba.
+        Args:
+            features (np.ndarray): Le feature con forma (B, N).
+        Returns:
+            List[Prediction]: Per ogni riga, l'etichetta prevista e il punteggio di confidenza.
+        """
+        results = self.model.predict(features)
 
         try:
-            confidence_score = self.model.predict_proba(features)[0].max()
+            confidence_scores = self.model.predict_proba(features).max(axis=1)
         except Exception:
-            result = "Sconosciuto"
-            confidence_score = 0.0
-        
-        return {
-            "label": str(result),
-            "confidence": float(confidence_score)
-        }
\ No newline at end of file
+            return [Prediction("Sconosciuto", 0.0)] * len(results)
+
+        return [
+            Prediction(str(result), float(confidence_score))
+            for result, confidence_score in zip(results, confidence_scores)
+        ]
+
+    async def analyze(self, context: MLAnalysisContext):
+        """
+        Esegue l'analisi utilizzando il modello di machine learning.
+        Args:
+            context (MLAnalysisContext): Il contesto contenente i dati per l'analisi.
+        Returns:
+            Prediction: L'etichetta prevista e il punteggio di confidenza.
+        Raises:
+            ValueError: Se le feature non sono fornite o sono vuote."""
+        features = self.prepare_features(context.payload["features"])
+        return self.predict_batch(features)[0]
+
+class BatchingAnalyzerWrapper(AnalysisStrategy):
+    """
+    Strategia che raggruppa le previsioni ML delle richieste concorrenti.
+    Le feature in arrivo vengono accodate e, dopo una breve attesa, valutate dal modello in un'unica chiamata;
+    i risultati vengono poi distribuiti alle singole richieste.
+
+    Attributes:
+        strategy (MLStrategy): La strategia ML che esegue le previsioni sul batch.
+        max_batch_size (int): Numero massimo di vettori di feature per batch.
+        max_wait (float): Tempo massimo in secondi di attesa di altre richieste prima di valutare il batch.
+    """
+    def __init__(self, strategy: MLStrategy, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.strategy = strategy
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+
+    async def analyze(self, context: MLAnalysisContext):
+        """
+        Esegue l'analisi accodando le feature del contesto al prossimo batch.
+        Args:
+            context (MLAnalysisContext): Il contesto contenente i dati per l'analisi.
+        Returns:
+            Prediction: L'etichetta prevista e il punteggio di confidenza.
+        Raises:
+            ValueError: Se le feature non sono fornite o sono vuote.
+        """
+        return await self.submit(context.payload["features"])
+
+    async def submit(self, features: Any) -> Prediction:
+        """
+        Accoda le feature al prossimo batch e ne attende il risultato.
+        Args:
+            features (Any): Le feature da valutare, come lista o array numpy.
+        Returns:
+            Prediction: L'etichetta prevista e il punteggio di confidenza.
+        Raises:
+            ValueError: Se le feature non sono fornite o sono vuote.
+        """
+        features = self.strategy.prepare_features(features)
+
+        # La coda e il task di raccolta vengono creati alla prima richiesta, quando l'event loop è in esecuzione
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self.collect_batches())
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((features, future))
+        return await future
+
+    async def collect_batches(self):
+        """
+        Raccoglie le richieste accodate entro la finestra di attesa e le valuta a batch.
+        """
+        while True:
+            items = [await self.queue.get()]
+            await asyncio.sleep(self.max_wait)
+            while len(items) < self.max_batch_size and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+
+            # Le richieste con un numero diverso di feature non possono essere impilate nella stessa matrice
+            groups: Dict[int, list] = {}
+            for features, future in items:
+                if not future.done():
+                    groups.setdefault(features.shape[1], []).append((features, future))
+
+            for group in groups.values():
+                self.run_batch(group)
+
+    def run_batch(self, items: list):
+        """
+        Valuta un gruppo di richieste con un'unica chiamata al modello e ne imposta i risultati.
+        Args:
+            items (list): Coppie (feature, future) con lo stesso numero di feature.
+        """
+        try:
+            results = self.strategy.predict_batch(np.concatenate([features for features, _ in items], axis=0))
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Ogni richiesta riceve la prima riga del proprio vettore di feature
+        offset = 0
+        for features, future in items:
+            if not future.done():
+                future.set_result(results[offset])
+            offset += features.shape[0]
+
+    async def close(self):
+        """
+        Arresta il task di raccolta dei batch.
+        """
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
@@ -1,6 +1,10 @@
 from rules_service import get_rules_for_field, violated_rule
 from base import AnalysisStrategy
 from contexts import RuleAnalysisContext
+import logging
+
+# Logger del modulo: la valutazione delle singole regole viene registrata solo a livello DEBUG
+logger = logging.getLogger(__name__)
 
 class RuleBasedStrategy(AnalysisStrategy[RuleAnalysisContext]):
     """
@@ -31,10 +35,10 @@ class RuleBasedStrategy(AnalysisStrategy[RuleAnalysisContext]):
         for rule in rules:
             if rule["sensor_type"] == payload["sensor_type"]:
 
-                print("Evaluating rule:", rule, "with payload type:", payload["sensor_type"])
+                logger.debug("Evaluating rule: %s with payload type: %s", rule, payload["sensor_type"])
 
                 if violated_rule(rule["condition"], payload["value"], rule["threshold"]):
-                    print(f"Alert! Rule {rule} not satisfied for payload {payload}") 
+                    logger.debug("Alert! Rule %s not satisfied for payload %s", rule, payload)
                     alerts.append(rule)
 
         return alerts
\ No newline at end of file
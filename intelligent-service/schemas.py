@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 admitted_conditions = {">", "<", "=="} # Condizioni ammesse per le regole
 
@@ -46,5 +46,4 @@ class RuleOutput(BaseModel):
     threshold: float
     field: str
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
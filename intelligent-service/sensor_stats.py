@@ -0,0 +1,15 @@
+import numpy as np
+
+def sensor_means(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Calcola la media delle letture di ciascun sensore a partire da un unico array concatenato.
+    Le somme di tutti i segmenti sono calcolate con una sola riduzione vettoriale (np.add.reduceat).
+    Args:
+        values (np.ndarray): Letture di tutti i sensori concatenate in un array monodimensionale.
+        offsets (np.ndarray): Indici di inizio dei segmenti di ciascun sensore, seguiti dalla lunghezza totale
+            (len(offsets) = numero di sensori + 1). Ogni segmento deve contenere almeno una lettura.
+    Returns:
+        np.ndarray: Media delle letture di ciascun sensore.
+    """
+    sums = np.add.reduceat(values, offsets[:-1])
+    return sums / np.diff(offsets)
@@ -17,6 +17,9 @@ ALERTS_ROUTING_KEY = os.getenv("RABBITMQ_ALERTS_ROUTING_KEY", "alerts.*")
 FIELD_SERVICE_URL = os.getenv("FIELD_SERVICE_URL", "http://field-service:8004")
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis-notifications:6379")
 
+# Segreto condiviso con il field-service per l'autenticazione delle chiamate agli endpoint /internal
+INTERNAL_SECRET = os.getenv("INTERNAL_SECRET") # Obbligatorio: il servizio non si avvia se manca o è vuoto
+
 REDIS_MAX_CONNECTIONS = 20
 
 consumer : RabbitMQNotificationConsumer = None
@@ -50,7 +53,12 @@ def decode_access_token(jwt_token: str) -> dict:
 async def lifespan(app: FastAPI):
     """
     Gestione del ciclo di vita dell'applicazione FastAPI. Inizializza e chiude le risorse necessarie.
+    Raises:
+        RuntimeError: Se il segreto condiviso INTERNAL_SECRET non è configurato.
     """
+    if not INTERNAL_SECRET:
+        raise RuntimeError("Variabile d'ambiente INTERNAL_SECRET mancante o vuota: il servizio non può essere avviato.")
+
     global consumer, http_client, redis
 
     http_client = httpx.AsyncClient()
@@ -78,14 +86,13 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(title="Notification Service", lifespan=lifespan)
 
-async def check_field_permission(field: str, user_id: str, token: str) -> bool:
+async def check_field_permission(field: str, user_id: str) -> bool:
     """
     Verifica se l'utente ha i permessi per accedere al campo specificato.
     Utilizza Redis per la memorizzazione nella cache dei permessi.
     Args:
         field (str): Nome del campo da verificare.
         user_id (str): ID dell'utente.
-        token (str): Token di accesso JWT dell'utente.
     Returns:
         bool: True se l'utente ha i permessi, altrimenti solleva WebSocketDisconnect.
     """
@@ -103,7 +110,7 @@ async def check_field_permission(field: str, user_id: str, token: str) -> bool:
     
     # Se la cache non è disponibile o non contiene l'informazione, fare la richiesta al Field Service
     try:
-        response = await http_client.get(f"{FIELD_SERVICE_URL}/internal/validate-field-owner", params={"field_name": field}, headers={"Authorization": f"Bearer {token}"})
+        response = await http_client.get(f"{FIELD_SERVICE_URL}/internal/validate-field-owner", params={"field_name": field, "user_id": user_id}, headers={"X-Internal-Secret": INTERNAL_SECRET})
 
         if response.status_code == 200:
             if redis:
@@ -144,7 +151,7 @@ async def websocket_endpoint(websocket: WebSocket, field: str, token: str):
         if not user_id:
             raise WebSocketDisconnect(code=1008, reason="Token non valido.")
 
-        await check_field_permission(field, user_id, token)
+        await check_field_permission(field, user_id)
 
     except WebSocketDisconnect as e:
         print(f"Rifiuto connessione WebSocket per field: {field}, motivo: {e.reason}")